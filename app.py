@@ -4,175 +4,415 @@
 import os
 import sys
 import json
-import subprocess
+import shlex
+import shutil
+import hashlib
+import time
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import date, timedelta
+from pathlib import Path
 
 import streamlit as st
 
-# tentar carregar .env se a lib existir; se não existir, passa batido
-try:
-    from dotenv import load_dotenv  # type: ignore
-    load_dotenv()
-except Exception:
-    pass
-
 # ====== chaves (preferir Secrets quando hospedado) ======
-OPENAI_API_KEY = st.secrets.get("OPENAI_API_KEY") if hasattr(st, "secrets") else None
-if not OPENAI_API_KEY:
-    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+@st.cache_resource(show_spinner=False)
+def _keys() -> tuple:
+    """Lê .env/Secrets uma vez por processo (não a cada rerun)."""
+    # tentar carregar .env se a lib existir; se não existir, passa batido
+    try:
+        from dotenv import load_dotenv  # type: ignore
+        load_dotenv()
+    except Exception:
+        pass
+
+    openai_key = st.secrets.get("OPENAI_API_KEY") if hasattr(st, "secrets") else None
+    if not openai_key:
+        openai_key = os.getenv("OPENAI_API_KEY")
+
+    convertapi_token = st.secrets.get("CONVERTAPI_TOKEN") if hasattr(st, "secrets") else None
+    if not convertapi_token:
+        convertapi_token = os.getenv("CONVERTAPI_TOKEN")
+    return openai_key, convertapi_token
+
 
-CONVERTAPI_TOKEN = st.secrets.get("CONVERTAPI_TOKEN") if hasattr(st, "secrets") else None
-if not CONVERTAPI_TOKEN:
-    CONVERTAPI_TOKEN = os.getenv("CONVERTAPI_TOKEN")
+OPENAI_API_KEY, CONVERTAPI_TOKEN = _keys()
 
 # ====== caminhos ======
 HERE = os.path.dirname(os.path.abspath(__file__))
-SCRIPT_PATH = os.path.join(HERE, "licitacoes_pdf.py")
 
-if not os.path.exists(SCRIPT_PATH):
-    st.error(f"Arquivo 'licitacoes_pdf.py' não encontrado em: {SCRIPT_PATH}")
+# gerador roda num processo filho por relatório (com forkserver, já nasce com o módulo importado);
+# import com falha não fica em sys.modules: cada rerun tenta de novo e mostra o erro
+if HERE not in sys.path:
+    sys.path.insert(0, HERE)
+try:
+    import licitacoes_pdf  # noqa: E402
+except ImportError as e:
+    st.error(f"Não foi possível carregar 'licitacoes_pdf.py' em {HERE}: {e}")
     st.stop()
 
+SCRIPT_PATH = licitacoes_pdf.__file__
+
+# cache em disco dos artefatos (sobrevive a reinícios do servidor)
+CACHE_DIR = Path(HERE) / ".cache"
+CACHE_TTL = 3600  # segundos
+CACHE_MAX_ENTRIES = 200
+CACHE_PDF_NAME = "report.pdf"  # nome fixo no cache; o nome digitado vale só para o download
+
+# cache HTTP da consulta ao PNCP (requests-cache, se instalado); herdado pelos workers
+os.environ.setdefault("PODIUM_CACHE_DIR", str(CACHE_DIR / "http"))
+# subpastas compartilhadas do gerador (http/, pdftext/): fora do LRU de relatórios
+CACHE_SHARED_DIRS = frozenset({"http", "pdftext"})
+
+LOG_TAIL = 16384  # caracteres de log exibidos na tela (o restante vai no download)
+
+REPORT_WORKERS = 2
+REPORT_TIMEOUT = 600  # segundos de execução do job (sem contar a fila)
+REPORT_TICK = 0.5  # intervalo de atualização do status (s)
+
 st.set_page_config(page_title="Relatório de Licitações (PNCP)", layout="wide")
 st.title("Relatório de Licitações (PNCP)")
 
 # ====== UI ======
-with st.sidebar:
-    st.subheader("Parâmetros de busca")
-
-    # Palavra, UF, Órgão
-    palavra = st.text_input("Palavra-chave (ex.: software)", value="")
-    col_uf, col_org = st.columns([1, 2])
-    with col_uf:
-        uf = st.text_input("UF (opcional)", value="", max_chars=2).upper()
-    with col_org:
-        orgao = st.text_input("Órgão (opcional)", value="")
-
-    # Valor mínimo (NOVO CAMPO)
-    min_valor = st.number_input("Valor mínimo (R$)", min_value=0.0, step=1000.0, format="%.2f")
-
-    # Modalidade
-    modalidades = [
-        "pregao eletronico",
-        "pregao presencial",
-        "concorrencia eletronica",
-        "concorrencia presencial",
-        "dispensa",
-        "inexigibilidade",
-        "credenciamento",
-        "dialogo competitivo",
-        "concurso",
-        "manifestacao de interesse",
-        "pre-qualificacao",
-        "leilao eletronico",
-        "leilao presencial",
-        "inaplicabilidade",
-    ]
-    modalidade = st.selectbox("Modalidade", modalidades, index=0)
+MODALIDADES = (
+    "pregao eletronico",
+    "pregao presencial",
+    "concorrencia eletronica",
+    "concorrencia presencial",
+    "dispensa",
+    "inexigibilidade",
+    "credenciamento",
+    "dialogo competitivo",
+    "concurso",
+    "manifestacao de interesse",
+    "pre-qualificacao",
+    "leilao eletronico",
+    "leilao presencial",
+    "inaplicabilidade",
+)
+_MODALIDADES_SET = frozenset(MODALIDADES)
+
+
+@dataclass
+class Params:
+    palavra: str
+    uf: str
+    orgao: str
+    min_valor: float
+    modalidade: str
+    d_inicial: date
+    d_final: date
+    tamanho_pagina: int
+    use_ai: bool
+    gen_pdf: bool
+    filename: str
+    show_inline: bool
+    run: bool
+
+
+def _sidebar() -> Params:
+    """Parâmetros num st.form: digitar/alterar campos não dispara rerun até o envio."""
+    with st.sidebar:
+        st.subheader("Parâmetros de busca")
+
+        with st.form("params"):
+            # Palavra, UF, Órgão
+            palavra = st.text_input("Palavra-chave (ex.: software)", value="")
+            col_uf, col_org = st.columns([1, 2])
+            with col_uf:
+                uf = st.text_input("UF (opcional)", value="", max_chars=2).upper()
+            with col_org:
+                orgao = st.text_input("Órgão (opcional)", value="")
 
-    # Datas (calendário)
-    today = date.today()
-    d_final = st.date_input("Data final", value=today)
-    d_inicial = st.date_input("Data inicial", value=today - timedelta(days=30))
-    if d_inicial > d_final:
-        st.warning("A data inicial não pode ser maior que a data final.")
+            # Valor mínimo (NOVO CAMPO)
+            min_valor = st.number_input("Valor mínimo (R$)", min_value=0.0, step=1000.0, format="%.2f")
 
-    # Demais opções
-    tamanho_pagina = st.slider("Tamanho da página (resultados PNCP)", min_value=10, max_value=200, value=50, step=10)
-    use_ai = st.checkbox("Analise por IA", value=True)
-    gen_pdf = st.checkbox("Gerar PDF", value=False)
-    show_inline = st.checkbox("Exibir HTML dentro do app", value=True)
-    filename = st.text_input("Nome do PDF (quando marcado)", value="licitacoes.pdf")
+            # Modalidade
+            modalidade = st.selectbox("Modalidade", MODALIDADES, index=0)
 
-    run_btn = st.button("Gerar relatório")
+            # Datas (calendário)
+            today = date.today()
+            d_final = st.date_input("Data final", value=today)
+            d_inicial = st.date_input("Data inicial", value=today - timedelta(days=30))
+            if d_inicial > d_final:
+                st.warning("A data inicial não pode ser maior que a data final.")
+
+            # Demais opções
+            tamanho_pagina = st.slider("Tamanho da página (resultados PNCP)", min_value=10, max_value=200, value=50, step=10)
+            use_ai = st.checkbox("Analise por IA", value=True)
+            gen_pdf = st.checkbox("Gerar PDF", value=False)
+            filename = st.text_input("Nome do PDF (quando marcado)", value="licitacoes.pdf")
+
+            run = st.form_submit_button("Gerar relatório")
+
+        # fora do form: só muda a exibição, vale na hora
+        show_inline = st.checkbox("Exibir HTML dentro do app", value=True)
+
+    return Params(palavra, uf, orgao, min_valor, modalidade, d_inicial, d_final, tamanho_pagina,
+                  use_ai, gen_pdf, filename, show_inline, run)
+
+
+prm = _sidebar()
 
 st.divider()
 
 # ====== Execução ======
 def yyyymmdd(d: date) -> str:
-    return d.strftime("%Y%m%d")
+    return f"{d.year:04d}{d.month:02d}{d.day:02d}"
 
-if run_btn:
-    # Monta comando
+
+def _build_args(modalidade: str, d_ini: str, d_fim: str, page: int, palavra: str, uf: str,
+                orgao: str, min_valor: float, ai: bool, pdf: bool, filename: str) -> list:
+    """Linha de comando equivalente (só para exibição)."""
     args = [
         sys.executable,
         SCRIPT_PATH,
         "--modalidade", modalidade,
-        "--data-inicial", yyyymmdd(d_inicial),
-        "--data-final", yyyymmdd(d_final),
-        "--tamanho-pagina", str(tamanho_pagina),
-        "--ai", "1" if use_ai else "0",
-        "--pdf", "1" if gen_pdf else "0",
+        "--data-inicial", d_ini,
+        "--data-final", d_fim,
+        "--tamanho-pagina", str(page),
+        "--ai", "1" if ai else "0",
+        "--pdf", "1" if pdf else "0",
         "--filename", filename,
     ]
-    if palavra:
-        args += ["--palavra", palavra]
-    if uf:
-        args += ["--uf", uf]
-    if orgao:
-        args += ["--orgao", orgao]
-    # >>> NOVO: passa valor mínimo <<<
-    if min_valor and float(min_valor) > 0:
-        args += ["--min-valor", f"{float(min_valor):.2f}"]
-
-    # Ambiente com as chaves (sem exibir)
-    env = os.environ.copy()
-    if OPENAI_API_KEY:
-        env["OPENAI_API_KEY"] = OPENAI_API_KEY
-    if CONVERTAPI_TOKEN:
-        env["CONVERTAPI_TOKEN"] = CONVERTAPI_TOKEN
+    # opcionais só entram quando preenchidos (inclui o valor mínimo)
+    opt = (
+        ("--palavra", palavra),
+        ("--uf", uf),
+        ("--orgao", orgao),
+        ("--min-valor", f"{float(min_valor):.2f}" if min_valor and float(min_valor) > 0 else None),
+    )
+    args.extend(v for pair in opt if pair[1] for v in pair)
+    return args
+
+
+@st.cache_data(show_spinner=False)
+def _fmt_cmd(args: tuple, script: str) -> str:
+    """Comando pronto para copiar (caminho do script abreviado, argumentos com aspas)."""
+    return shlex.join("licitacoes_pdf.py" if a == script else a for a in args)
+
+
+def _cache_key(params: dict) -> str:
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _cache_fresh(cache_dir: Path) -> bool:
+    html = cache_dir / "licitacoes.html"
+    return html.exists() and (time.time() - html.stat().st_mtime) < CACHE_TTL
+
+
+def _evict_cache() -> None:
+    """LRU: remove os diretórios menos usados além de CACHE_MAX_ENTRIES."""
+    try:
+        entries = sorted(
+            (p for p in CACHE_DIR.iterdir() if p.is_dir() and p.name not in CACHE_SHARED_DIRS),
+            key=lambda p: p.stat().st_mtime,
+        )
+    except OSError:
+        return
+    for old in entries[:-CACHE_MAX_ENTRIES]:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def _read_cached(cache_dir: Path, pdf: bool) -> "licitacoes_pdf.ReportBundle":
+    """Lê os artefatos do cache em paralelo (as leituras se sobrepõem no kernel)."""
+    def _submit(ex: ThreadPoolExecutor, path: Path):
+        return ex.submit(path.read_bytes) if path.exists() else None
+
+    def _result(fut):
+        return fut.result() if fut is not None else None
+
+    with ThreadPoolExecutor(4) as ex:
+        html_f = _submit(ex, cache_dir / "licitacoes.html")
+        json_f = _submit(ex, cache_dir / "licitacoes.json")
+        pdf_f = _submit(ex, cache_dir / CACHE_PDF_NAME) if pdf else None
+        logs_f = _submit(ex, cache_dir / "logs.txt")
+
+    return licitacoes_pdf.ReportBundle(
+        html=_result(html_f) or b"",
+        json=_result(json_f) or b"",
+        pdf=_result(pdf_f),
+        logs=(_result(logs_f) or b"").decode("utf-8"),
+    )
+
+
+def _write_cached(cache_dir: Path, bundle: "licitacoes_pdf.ReportBundle") -> None:
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    (cache_dir / "licitacoes.json").write_bytes(bundle.json)
+    (cache_dir / "logs.txt").write_text(bundle.logs, encoding="utf-8")
+    if bundle.pdf is not None:
+        (cache_dir / CACHE_PDF_NAME).write_bytes(bundle.pdf)
+    # por último: a presença do HTML marca a entrada como completa
+    (cache_dir / "licitacoes.html").write_bytes(bundle.html)
+
+
+@st.cache_resource(show_spinner=False)
+def _report_ctx():
+    """Contexto dos processos de relatório (um por job, dá para matar só o travado).
+
+    Com forkserver (Linux), cada job nasce de um fork do servidor que já importou o gerador
+    e as libs de PDF; senão, spawn (import a cada job).
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload(["licitacoes_pdf", "pypdfium2", "pypdf", "pdfminer.high_level"])
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+@st.cache_resource(show_spinner=False)
+def _report_slots() -> threading.BoundedSemaphore:
+    """No máximo REPORT_WORKERS relatórios rodando ao mesmo tempo (compartilhado entre sessões)."""
+    return threading.BoundedSemaphore(REPORT_WORKERS)
+
+
+def _wait_report(params: dict, _on_tick=None) -> "licitacoes_pdf.ReportBundle":
+    """Roda generate_report num processo próprio; o tempo limite conta do início do job, não da fila."""
+    t0 = time.monotonic()
+    slots = _report_slots()
+    while not slots.acquire(timeout=REPORT_TICK):
+        if _on_tick:
+            _on_tick(time.monotonic() - t0)
+    try:
+        ctx = _report_ctx()
+        recv, send = ctx.Pipe(duplex=False)
+        proc = ctx.Process(target=licitacoes_pdf.report_worker, args=(params, send), daemon=True)
+        proc.start()
+        send.close()
+        started = time.monotonic()
+        try:
+            while not recv.poll(REPORT_TICK):
+                now = time.monotonic()
+                if now - started > REPORT_TIMEOUT:
+                    raise TimeoutError(f"tempo limite de {REPORT_TIMEOUT}s excedido")
+                if _on_tick:
+                    _on_tick(now - t0)
+            try:
+                status, payload = recv.recv()
+            except EOFError:
+                # processo morreu sem responder (crash nativo, OOM)
+                proc.join()
+                raise RuntimeError(f"processo do relatório terminou sem resultado (código {proc.exitcode})")
+        finally:
+            if proc.is_alive():
+                proc.kill()  # só este job; os das outras sessões seguem
+            proc.join()
+            recv.close()
+    finally:
+        slots.release()
+    if status != "ok":
+        raise payload
+    return payload
+
+
+class DegradedReport(Exception):
+    """Relatório com falha parcial: levantado para o st.cache_data não guardar (exceções não entram no cache)."""
+
+    def __init__(self, bundle: "licitacoes_pdf.ReportBundle"):
+        super().__init__("relatório com falhas parciais")
+        self.bundle = bundle
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _run_report(modalidade: str, d_ini: str, d_fim: str, page: int, palavra: str, uf: str,
+                orgao: str, min_valor: float, ai: bool, pdf: bool,
+                _on_tick=None) -> "licitacoes_pdf.ReportBundle":
+    """Gera o relatório; cliques repetidos com os mesmos parâmetros vêm do cache.
+
+    Antes de gerar, procura o resultado em disco (.cache/<hash dos parâmetros>).
+    `_on_tick(segundos)` é chamado enquanto o worker trabalha (fora da chave de cache).
+    O nome do PDF não entra aqui: só vale no botão de download.
+    """
+    params = {
+        "modalidade": modalidade, "data_inicial": d_ini, "data_final": d_fim, "tamanho_pagina": page,
+        "palavra": palavra, "uf": uf, "orgao": orgao, "min_valor": min_valor, "ai": int(ai), "pdf": int(pdf),
+    }
+    cache_dir = CACHE_DIR / _cache_key(params)
+
+    if _cache_fresh(cache_dir):
+        os.utime(cache_dir)  # marca uso recente (LRU)
+        return _read_cached(cache_dir, pdf)
+
+    # chaves (e a pasta de cache do gerador) entram só aqui, fora da chave de cache
+    job = dict(params, openai_key=OPENAI_API_KEY or "", convertapi_token=CONVERTAPI_TOKEN or "", cache_dir=str(CACHE_DIR))
+    bundle = _wait_report(job, _on_tick)
+    if bundle.degraded:  # nem em disco nem no st.cache_data: o próximo clique tenta de novo
+        raise DegradedReport(bundle)
+    _write_cached(cache_dir, bundle)
+    _evict_cache()
+    return bundle
+
+
+def _show_logs(logs: str) -> None:
+    st.write("**Logs:**")
+    if len(logs) > LOG_TAIL:
+        st.caption(f"Exibindo os últimos {LOG_TAIL} caracteres.")
+    st.code(logs[-LOG_TAIL:] or "(vazio)")
+    if logs:
+        st.download_button("Baixar logs completos", data=logs, file_name="licitacoes.log", mime="text/plain")
+
+
+if prm.run:
+    if prm.modalidade not in _MODALIDADES_SET:
+        st.error(f"Modalidade inválida: {prm.modalidade}")
+        st.stop()
+
+    params = (prm.modalidade, yyyymmdd(prm.d_inicial), yyyymmdd(prm.d_final), prm.tamanho_pagina, prm.palavra,
+              prm.uf, prm.orgao, float(prm.min_valor or 0), prm.use_ai, prm.gen_pdf)
 
     # Mostra um resumo (sem chaves)
     with st.expander("Comando", expanded=False):
-        safe_cmd = " ".join([a if a != SCRIPT_PATH else "licitacoes_pdf.py" for a in args])
-        st.code(safe_cmd)
+        st.code(_fmt_cmd(tuple(_build_args(*params, prm.filename)), SCRIPT_PATH))
 
-    # Chama o script
+    # Gera o relatório
     with st.status("Rodando consulta e montando relatório...", expanded=True) as status:
+        def _tick(elapsed: float) -> None:
+            status.update(label=f"Rodando consulta e montando relatório... {elapsed:.0f}s")
+
         try:
-            proc = subprocess.run(args, env=env, capture_output=True, text=True, cwd=HERE, timeout=600)
+            bundle = _run_report(*params, _on_tick=_tick)
+        except DegradedReport as e:
+            bundle = e.bundle
+            st.warning("Relatório gerado com falhas parciais (veja os logs); não foi guardado em cache.")
+        except licitacoes_pdf.ReportError as e:
+            _show_logs(e.logs)
+            st.error(f"Falha ao gerar relatório: {e}")
+            st.stop()
         except Exception as e:
-            st.error(f"Falha ao executar o script: {e}")
+            st.error(f"Falha ao gerar relatório: {e}")
             st.stop()
 
-        st.write("**STDOUT:**")
-        st.code(proc.stdout or "(vazio)")
-        st.write("**STDERR (logs):**")
-        st.code(proc.stderr or "(vazio)")
-
-        if proc.returncode != 0:
-            st.error(f"Script terminou com código {proc.returncode}. Veja os logs acima.")
-            st.stop()
+        _show_logs(bundle.logs)
         status.update(label="Relatório gerado.", state="complete")
 
-    # Saídas
-    html_path = os.path.join(HERE, "licitacoes.html")
-    json_path = os.path.join(HERE, "licitacoes.json")
-    pdf_path = os.path.join(HERE, filename)
+    # guarda os artefatos na sessão: reruns seguintes (downloads, checkbox) não refazem nada
+    st.session_state.artifacts = {
+        "key": params,
+        "bundle": bundle,
+    }
 
+# Saídas
+artifacts = st.session_state.get("artifacts")
+if artifacts:
+    bundle = artifacts["bundle"]
     cols = st.columns(3)
-    if os.path.exists(html_path):
-        with open(html_path, "r", encoding="utf-8") as fh:
-            html_content = fh.read()
-
+    if bundle.html:
         with cols[0]:
-            st.download_button("Baixar HTML", data=html_content, file_name="licitacoes.html", mime="text/html")
+            st.download_button("Baixar HTML", data=bundle.html, file_name="licitacoes.html", mime="text/html")
 
-        if show_inline:
+        if prm.show_inline:
             st.subheader("Visualização do Relatório (HTML)")
-            st.components.v1.html(html_content, height=900, scrolling=True)
+            st.components.v1.html(bundle.html.decode("utf-8", "replace"), height=900, scrolling=True)
 
-    if os.path.exists(json_path):
-        with open(json_path, "r", encoding="utf-8") as fj:
-            json_content = fj.read()
+    if bundle.json:
         with cols[1]:
-            st.download_button("Baixar JSON", data=json_content, file_name="licitacoes.json", mime="application/json")
+            st.download_button("Baixar JSON", data=bundle.json, file_name="licitacoes.json", mime="application/json")
 
-    if gen_pdf and os.path.exists(pdf_path):
-        with open(pdf_path, "rb") as fp:
-            pdf_bytes = fp.read()
+    if bundle.pdf is not None:
         with cols[2]:
-            st.download_button("Baixar PDF", data=pdf_bytes, file_name=filename, mime="application/pdf")
+            st.download_button("Baixar PDF", data=bundle.pdf, file_name=prm.filename or "licitacoes.pdf", mime="application/pdf")
 
 # Rodapé discreto
 st.caption("PNCP • Geração de Relatório • Streamlit")
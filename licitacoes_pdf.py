@@ -7,7 +7,7 @@ Funcionalidades:
 - Consulta PNCP por janela de datas, UF e modalidade
 - Enriquecimento: tenta achar Valor Estimado em:
   (1) HTML visível, (2) JSON inline, (3) endpoints JSON referenciados na página,
-  (4) PDF do edital/anexo (ConvertAPI + fallback local pdfminer.six)
+  (4) PDF do edital/anexo (pypdfium2/pypdf local; ConvertAPI/pdfminer.six como fallback)
 - Resumo executivo (IA) + análise por item (IA) com:
   Categoria, Tipo/Modelo de precificação e Ações recomendadas
 - Risco de Prazo (local, sem IA)
@@ -19,23 +19,91 @@ Autor: Fabricio + ajustes do assistente
 from __future__ import annotations
 
 import argparse
+import bisect
+import hashlib
 import io
 import json
 import os
 import re
 import sys
+import threading
+import traceback
+import unicodedata
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass, field, asdict
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Tuple
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from urllib.parse import urljoin
 
 import requests
 from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# parser em C quando disponível (bem mais rápido que o html.parser puro Python)
+try:
+    import lxml  # type: ignore  # noqa: F401
+    HTML_PARSER = "lxml"
+except Exception:
+    HTML_PARSER = "html.parser"
+
+# orjson (C) para o JSON do OpenAI, se instalado; senão json da stdlib
+try:
+    import orjson  # type: ignore
+except Exception:
+    orjson = None
+
+# RE2 (google-re2) casa em tempo linear, sem backtracking; usado nos regex de PDF se instalado
+try:
+    import re2  # type: ignore
+except Exception:
+    re2 = None
 
 # ======================= Constantes e utilidades =======================
 
 PNCP_URL = "https://pncp.gov.br/api/consulta/v1/contratacoes/publicacao"
 
+# Sessão única (keep-alive): reaproveita TCP/TLS entre chamadas ao mesmo host.
+HTTP_POOL_SIZE = 32
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE,
+                       # só 502/503/504 em GET/HEAD são repetidos (a última resposta volta normalmente);
+                       # timeout de leitura não se repete (cada tentativa custaria o timeout inteiro) e
+                       # falha de conexão tem uma segunda chance só
+                       max_retries=Retry(total=3, connect=1, read=0, other=0, backoff_factor=0.5,
+                                         status_forcelist=(502, 503, 504), raise_on_status=False))
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
+SESSION.headers["Accept-Encoding"] = "gzip, deflate"
+
+# Cache HTTP em disco (opcional) só para a consulta ao PNCP: ativo quando PODIUM_CACHE_DIR
+# aponta uma pasta e requests-cache está instalado. Sessão própria, sem install_cache: o
+# cache global leria o corpo inteiro das respostas em stream (página, PDFs) para gravá-lo.
+HTTP_CACHE_DIR = os.getenv("PODIUM_CACHE_DIR", "")
+HTTP_CACHE_TTL = 3600  # segundos
+
+
+@lru_cache(maxsize=1)
+def pncp_session() -> requests.Session:
+    """Sessão da consulta ao PNCP, criada no primeiro uso (o sqlite do cache não atravessa fork)."""
+    if HTTP_CACHE_DIR:
+        try:
+            import requests_cache  # type: ignore
+            os.makedirs(HTTP_CACHE_DIR, exist_ok=True)
+            cached = requests_cache.CachedSession(
+                os.path.join(HTTP_CACHE_DIR, "http_cache"), backend="sqlite", expire_after=HTTP_CACHE_TTL
+            )
+            # mesmo adapter da SESSION: mesma política de retry (só 502/503/504) e mesmo pool
+            cached.mount("https://", _adapter)
+            cached.mount("http://", _adapter)
+            cached.headers["Accept-Encoding"] = "gzip, deflate"
+            return cached
+        except Exception:
+            pass
+    return SESSION
+
+
 MODALIDADE_MAP = {
     "leilao eletronico": 1,
     "dialogo competitivo": 2,
@@ -55,6 +123,17 @@ MODALIDADE_MAP = {
 
 PDF_CANDIDATE_TEXT = re.compile(r"(edital|anexo|itens|item|termo|refer[eê]ncia|arquivo|download)", re.I)
 TRACKER_RX = re.compile(r"(googletagmanager|google-analytics|doubleclick|gstatic)", re.I)
+WINDOW_OPEN_RX = re.compile(r"window\.open\(['\"](.*?)['\"]", re.I)
+EDITAL_RX = re.compile(r"edital", re.I)
+ANEXO_RX = re.compile(r"(anexo|itens|item|termo|referencia)", re.I)
+URL_SCHEME_RX = re.compile(r"^[a-z]+://", re.I)
+MONEY_STRIP_RX = re.compile(r"[^\d,\.]")
+MONEY_CHARS = "0123456789,."
+MONEY_DEL = str.maketrans("", "", "".join(chr(c) for c in range(128) if chr(c) not in MONEY_CHARS))
+PDF_MAGIC = b"%PDF-"
+PDF_MAX_PAGES = 20        # extração local lê só as primeiras páginas
+PDF_MIN_TEXT_CHARS = 500  # abaixo disso (PDF escaneado?) tenta os fallbacks
+PDF_TEXT_CACHE_MAX = 2000  # textos de PDF guardados em <cache_dir>/pdftext (LRU)
 
 HTML_PATTERNS_VALOR = [
     re.compile(r"valor\s+(?:estimado|global|total)\s*[:\-]?\s*R?\$?\s*([\d\.\,]+)", re.I),
@@ -79,13 +158,85 @@ PDF_PATTERNS_ENCERRAMENTO = [
 ]
 
 
+# \s e \d do `re` em str são Unicode; no RE2 são só ASCII (NBSP do texto de PDF deixaria de casar)
+RE2_UNICODE_CLASSES = {
+    "s": r"\t\n\x{0b}\f\r\x{1c}-\x{20}\x{85}\x{a0}\x{1680}\x{2000}-\x{200a}\x{2028}\x{2029}\x{202f}\x{205f}\x{3000}",
+    "d": r"\p{Nd}",
+}
+
+
+def _re2_unicode(pattern: str) -> str:
+    r"""Troca \s/\d pelas classes equivalentes às do `re` (dentro ou fora de [...])."""
+    out, i, in_class = [], 0, False
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\" and i + 1 < len(pattern):
+            nxt = pattern[i + 1]
+            cls = RE2_UNICODE_CLASSES.get(nxt)
+            if cls is None:
+                out.append(pattern[i:i + 2])
+            else:
+                out.append(cls if in_class else f"[{cls}]")
+            i += 2
+            continue
+        if c == "[" and not in_class:
+            in_class = True
+        elif c == "]" and in_class:
+            in_class = False
+        out.append(c)
+        i += 1
+    return "".join(out)
+
+
+def compile_linear(pattern: str) -> Any:
+    """re2.compile quando disponível (flags inline no padrão); senão, ou se o RE2 recusar, re.compile."""
+    if re2 is not None:
+        try:
+            return re2.compile(_re2_unicode(pattern))
+        except Exception:
+            pass
+    return re.compile(pattern)
+
+
+def fuse_patterns(patterns: List[re.Pattern]) -> Any:
+    """Junta padrões de 1 grupo numa alternância só (uma passada no texto; vale o mais à esquerda)."""
+    parts = []
+    for p in patterns:
+        fl = "".join(c for f, c in ((re.I, "i"), (re.S, "s"), (re.M, "m")) if p.flags & f)
+        parts.append(f"(?{fl}:{p.pattern})" if fl else f"(?:{p.pattern})")
+    return compile_linear("|".join(parts))
+
+
+PDF_OBJETO_RX = fuse_patterns(PDF_PATTERNS_OBJETO)
+PDF_ABERTURA_RX = fuse_patterns(PDF_PATTERNS_ABERTURA)
+PDF_ENCERRAMENTO_RX = fuse_patterns(PDF_PATTERNS_ENCERRAMENTO)
+
+# VALOR não é fundido: a ordem da lista é prioridade (estimado > global > preço estimado)
+# palavras presentes em toda alternativa de cada padrão (em casefold): sem elas, nem roda o regex
+PDF_VALOR_ANCHORS = ("valor", "preço")
+PDF_OBJETO_ANCHORS = ("objeto",)
+PDF_ABERTURA_ANCHORS = ("abertura",)
+PDF_ENCERRAMENTO_ANCHORS = ("encerramento",)
+
+
+def _strip_accents(s: str) -> str:
+    s = unicodedata.normalize("NFD", s)
+    return "".join(ch for ch in s if unicodedata.category(ch) != "Mn")
+
+
+# Latin-1 + Latin Extended-A sem acento, calculado uma vez (cobre o português do PNCP)
+ACCENT_MAP = {
+    i: _strip_accents(chr(i)) for i in range(0xC0, 0x180) if _strip_accents(chr(i)) != chr(i)
+}
+
+
 def nlower(s: Optional[str]) -> str:
-    if s is None:
+    if not s:
         return ""
-    import unicodedata
-    s = unicodedata.normalize("NFD", s)
-    s = "".join(ch for ch in s if unicodedata.category(ch) != "Mn")
-    return s.lower()
+    t = s.translate(ACCENT_MAP)
+    if not t.isascii():
+        t = _strip_accents(t)  # caracteres fora da tabela
+    return t.lower()
 
 
 def clamp_tamanho_pagina(v: Any) -> int:
@@ -115,7 +266,7 @@ def normalize_url(raw: Optional[str]) -> str:
     url = str(raw).strip().replace("&amp;", "&")
     if url.startswith("www."):
         url = "https://" + url
-    if not re.match(r"^[a-z]+://", url, flags=re.I):
+    if not URL_SCHEME_RX.match(url):
         url = "https://" + url
     return url
 
@@ -130,13 +281,17 @@ def abs_url(href: str, base: str) -> Optional[str]:
 def money_br_to_number(s: Optional[str]) -> Optional[float]:
     if not s:
         return None
-    s = re.sub(r"[^\d,\.]", "", s).replace(".", "").replace(",", ".")
+    if s.strip(MONEY_CHARS):  # vazio => só dígitos/,/. (caso comum: grupo já capturado por regex)
+        # ASCII: apaga o resto via tabela; fora do ASCII (\d pega dígitos unicode) usa o regex
+        s = s.translate(MONEY_DEL) if s.isascii() else MONEY_STRIP_RX.sub("", s)
+    s = s.replace(".", "").replace(",", ".")
     try:
         return float(s)
     except Exception:
         return None
 
 
+@lru_cache(maxsize=1024)  # valores/datas se repetem entre cards (None, 0, mesmas datas)
 def fmt_money_br(v: Optional[float]) -> str:
     if v is None:
         return "—"
@@ -146,6 +301,7 @@ def fmt_money_br(v: Optional[float]) -> str:
         return "—"
 
 
+@lru_cache(maxsize=1024)
 def fmt_date_br(iso_like: Optional[str]) -> str:
     if not iso_like:
         return "—"
@@ -161,6 +317,20 @@ def esc_html(s: Any) -> str:
     return s.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;")
 
 
+def json_dumps_bytes(obj: Any) -> bytes:
+    """JSON compacto em UTF-8 (orjson quando possível)."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def json_loads(data: Any) -> Any:
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
 def pick_first(text: str, patterns: List[re.Pattern]) -> Optional[str]:
     if not text:
         return None
@@ -171,22 +341,40 @@ def pick_first(text: str, patterns: List[re.Pattern]) -> Optional[str]:
     return None
 
 
+def pick_fused(text: str, rx: Any, anchors: Tuple[str, ...] = (), text_cf: Optional[str] = None) -> Optional[str]:
+    """Como pick_first, para um padrão de fuse_patterns: o grupo casado é m.lastindex.
+
+    Com `anchors`, só roda o regex se alguma delas aparece em `text_cf` (text.casefold()).
+    """
+    if not text:
+        return None
+    if anchors:
+        if text_cf is None:
+            text_cf = text.casefold()
+        if not any(a in text_cf for a in anchors):
+            return None
+    m = rx.search(text)
+    if m and m.lastindex and m.group(m.lastindex):
+        return m.group(m.lastindex).strip()
+    return None
+
+
 # ======================= Data classes =======================
 
-@dataclass
+@dataclass(slots=True)
 class Unidade:
     codigo: Optional[str] = None
     nome: Optional[str] = None
     uf: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class Orgao:
     cnpj: Optional[str] = None
     razaoSocial: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class Resultado:
     numeroControlePNCP: Optional[str] = None
     numeroCompra: Optional[str] = None
@@ -217,25 +405,40 @@ class Resultado:
 
 # ======================= Núcleo PNCP =======================
 
-def decide_score(obj: Resultado, filtros: Dict[str, Any]) -> Tuple[int, str, Optional[str]]:
-    palavra = filtros.get("palavra") or ""
-    uf = filtros.get("uf") or ""
-    orgao_f = filtros.get("orgao") or ""
+def _prepare_filters(filtros: Dict[str, Any]) -> Dict[str, Any]:
+    """Normaliza os filtros uma vez por lote (não a cada resultado)."""
     minValor = filtros.get("minValor") or 0
     try:
         minValor = float(minValor)
     except Exception:
         minValor = 0.0
+    return {
+        "palavra_n": nlower(filtros.get("palavra") or ""),
+        "uf_u": str(filtros.get("uf") or "").upper(),
+        "orgao_n": nlower(filtros.get("orgao") or ""),
+        "minValor": minValor,
+    }
+
 
-    passaPalavra = True if not palavra else (nlower(obj.objetoCompra or "").find(nlower(palavra)) >= 0)
-    passaUf = True if not uf else ((obj.unidade.uf or "").upper() == str(uf).upper())
-    passaOrgao = True if not orgao_f else (nlower(obj.orgao.razaoSocial or "").find(nlower(orgao_f)) >= 0)
-    passaValor = True if not minValor else ((obj.valorEstimado or 0.0) >= minValor)
+def _score_fields(objeto: str, uf_item: str, nome_orgao: str, valor: Optional[float],
+                  prep: Dict[str, Any]) -> Tuple[int, str, Optional[str]]:
+    """Score direto dos campos crus (antes de montar o Resultado)."""
+    palavra = prep["palavra_n"]
+    uf = prep["uf_u"]
+    orgao_f = prep["orgao_n"]
+    minValor = prep["minValor"]
+    uf_item = uf_item.upper()
+    orgao_n = nlower(nome_orgao)
+
+    passaPalavra = True if not palavra else (nlower(objeto).find(palavra) >= 0)
+    passaUf = True if not uf else (uf_item == uf)
+    passaOrgao = True if not orgao_f else (orgao_n.find(orgao_f) >= 0)
+    passaValor = True if not minValor else ((valor or 0.0) >= minValor)
 
     score = (35 if passaPalavra else 0) + (20 if passaUf else 0) + (10 if passaOrgao else 0) + (35 if passaValor else 0)
 
     # Exemplo de regra de negócio
-    bloqueiaBahia = ((obj.unidade.uf or "").upper() == "BA") or ("bahia" in nlower(obj.orgao.razaoSocial or ""))
+    bloqueiaBahia = (uf_item == "BA") or ("bahia" in orgao_n)
     if bloqueiaBahia:
         return score, "descartar", "Excluído: órgão/UF Bahia"
     elif score >= 70:
@@ -244,6 +447,12 @@ def decide_score(obj: Resultado, filtros: Dict[str, Any]) -> Tuple[int, str, Opt
         return score, "avaliar", None
 
 
+def decide_score(obj: Resultado, filtros: Dict[str, Any]) -> Tuple[int, str, Optional[str]]:
+    """Score de um Resultado avulso (em lote, normalize_results prepara os filtros uma vez só)."""
+    return _score_fields(obj.objetoCompra or "", obj.unidade.uf or "", obj.orgao.razaoSocial or "",
+                         obj.valorEstimado, _prepare_filters(filtros))
+
+
 def resolve_modalidade_code(modalidade: Optional[str], cod: Optional[str]) -> int:
     if cod and str(cod).strip().isdigit():
         return int(str(cod).strip())
@@ -264,7 +473,7 @@ def fetch_pncp(params: Dict[str, Any]) -> Dict[str, Any]:
         "tamanhoPagina": params["tamanhoPagina"],
     }
     q = {k: v for k, v in q.items() if v not in (None, "", [])}
-    r = requests.get(PNCP_URL, params=q, timeout=60)
+    r = pncp_session().get(PNCP_URL, params=q, timeout=60)
     r.raise_for_status()
     data = r.json()
     arr = (data.get("_response", {}).get("data", {}).get("data")) or data.get("data") or []
@@ -273,10 +482,13 @@ def fetch_pncp(params: Dict[str, Any]) -> Dict[str, Any]:
 
 def normalize_results(arr: List[Dict[str, Any]], filtros: Dict[str, Any]) -> List[Resultado]:
     out: List[Resultado] = []
+    prep = _prepare_filters(filtros)
     for i in arr:
-        nomeOrgao = (i.get("orgaoEntidade") or {}).get("razaoSocial") or (i.get("orgaoEntidade") or {}).get("nome") or ""
-        nomeUnidade = (i.get("unidadeOrgao") or {}).get("nome") or ""
-        ufItem = (i.get("unidadeOrgao") or {}).get("uf") or ""
+        orgaoEntidade = i.get("orgaoEntidade") or {}
+        unidadeOrgao = i.get("unidadeOrgao") or {}
+        nomeOrgao = orgaoEntidade.get("razaoSocial") or orgaoEntidade.get("nome") or ""
+        nomeUnidade = unidadeOrgao.get("nome") or ""
+        ufItem = unidadeOrgao.get("uf") or ""
         objeto = i.get("objetoCompra") or ""
         valorEstimado = i.get("valorEstimado")
         try:
@@ -284,7 +496,13 @@ def normalize_results(arr: List[Dict[str, Any]], filtros: Dict[str, Any]) -> Lis
         except Exception:
             valorEstimado = None
 
-        res = Resultado(
+        # score sai dos campos já lidos; o Resultado nasce com a análise pronta
+        score, recomendacao, motivo = _score_fields(objeto, ufItem, nomeOrgao, valorEstimado, prep)
+        analise = {"score": score, "recomendacao": recomendacao}
+        if motivo:
+            analise["motivo"] = motivo
+
+        out.append(Resultado(
             numeroControlePNCP=i.get("numeroControlePNCP"),
             numeroCompra=i.get("numeroCompra"),
             anoCompra=i.get("anoCompra"),
@@ -300,60 +518,54 @@ def normalize_results(arr: List[Dict[str, Any]], filtros: Dict[str, Any]) -> Lis
             dataEncerramentoProposta=i.get("dataEncerramentoProposta"),
             dataPublicacaoPncp=i.get("dataPublicacaoPncp"),
             orgao=Orgao(
-                cnpj=(i.get("orgaoEntidade") or {}).get("cnpj"),
+                cnpj=orgaoEntidade.get("cnpj"),
                 razaoSocial=nomeOrgao,
             ),
             unidade=Unidade(
-                codigo=(i.get("unidadeOrgao") or {}).get("codigoUnidade"),
+                codigo=unidadeOrgao.get("codigoUnidade"),
                 nome=nomeUnidade,
                 uf=ufItem,
             ),
             linkSistemaOrigem=i.get("linkSistemaOrigem"),
-        )
-        score, recomendacao, motivo = decide_score(res, filtros)
-        res.analise = {"score": score, "recomendacao": recomendacao}
-        if motivo:
-            res.analise["motivo"] = motivo
-        out.append(res)
+            analise=analise,
+        ))
     return out
 
 
 # ======================= PDF / Página de origem =======================
 
 def find_pdf_links(page_url: str, html: str) -> Tuple[Optional[str], Optional[str]]:
-    soup = BeautifulSoup(html, "html.parser")
-    hrefs: List[str] = []
+    soup = BeautifulSoup(html, HTML_PARSER)
+    seen, uniq = set(), []
+
+    def add(h: str) -> None:
+        # âncoras/javascript não levam a documento; duplicados não pagam urljoin de novo
+        if not h or h[0] == "#" or h[:11].lower() == "javascript:" or h in seen:
+            return
+        seen.add(h)
+        u = abs_url(h, page_url)
+        if u and u not in seen:
+            seen.add(u)
+            if not TRACKER_RX.search(u):
+                uniq.append(u)
 
     for a in soup.find_all("a", href=True):
         href = a["href"].strip()
-        text = (a.get_text() or "").strip()
-        if href.lower().endswith(".pdf") or PDF_CANDIDATE_TEXT.search(text):
-            hrefs.append(href)
+        if href.lower().endswith(".pdf") or PDF_CANDIDATE_TEXT.search((a.get_text() or "").strip()):
+            add(href)
 
     for tag in soup.find_all(["iframe", "embed", "object"]):
-        src = (tag.get("src") or tag.get("data") or "").strip()
-        if src:
-            hrefs.append(src)
+        add((tag.get("src") or tag.get("data") or "").strip())
 
     for tag in soup.select("[data-href]"):
-        hrefs.append(tag["data-href"])
-
-    for m in re.finditer(r"window\.open\(['\"](.*?)['\"]", html, re.I):
-        hrefs.append(m.group(1))
-
-    base = page_url
-    seen, uniq = set(), []
-    for h in hrefs:
-        u = abs_url(h, base)
-        if u and u not in seen:
-            seen.add(u)
-            uniq.append(u)
+        add(tag["data-href"])
 
-    uniq = [u for u in uniq if not TRACKER_RX.search(u or "")]
+    for m in WINDOW_OPEN_RX.finditer(html):
+        add(m.group(1))
 
     cand_pdf = [u for u in uniq if str(u).lower().endswith(".pdf")]
-    edital = cand_pdf[0] if cand_pdf else next((u for u in uniq if re.search(r"edital", u, re.I)), None)
-    anexo = next((u for u in uniq if re.search(r"(anexo|itens|item|termo|referencia)", u, re.I) and u != edital), None)
+    edital = cand_pdf[0] if cand_pdf else next((u for u in uniq if EDITAL_RX.search(u)), None)
+    anexo = next((u for u in uniq if ANEXO_RX.search(u) and u != edital), None)
     return edital, anexo
 
 
@@ -361,46 +573,178 @@ def ensure_pdf_url(u: Optional[str]) -> Optional[str]:
     if not u:
         return None
     try:
-        hr = requests.head(u, allow_redirects=True, timeout=40)
+        hr = SESSION.head(u, allow_redirects=True, timeout=40)
         ct = (hr.headers.get("Content-Type") or "")
         if "application/pdf" in ct.lower():
             return hr.url
-        gr = requests.get(u, stream=True, allow_redirects=True, timeout=60)
-        ct = (gr.headers.get("Content-Type") or "")
-        if "application/pdf" in ct.lower():
-            return gr.url
+        gr = SESSION.get(u, stream=True, allow_redirects=True, timeout=60)
+        try:
+            ct = (gr.headers.get("Content-Type") or "")
+            # servidores que não rotulam o PDF: olha só os primeiros bytes
+            if "application/pdf" in ct.lower() or next(gr.iter_content(8), b"").startswith(PDF_MAGIC):
+                return gr.url
+        finally:
+            gr.close()  # não baixa o corpo
     except Exception:
         pass
     return None
 
 
-def pdf_to_text(pdf_bytes: bytes, token: Optional[str]) -> str:
-    """Tenta ConvertAPI; se falhar, tenta pdfminer.six local (se instalado)."""
+def ensure_pdf_urls(urls: List[Optional[str]]) -> List[Optional[str]]:
+    """ensure_pdf_url para vários candidatos em paralelo (mesma ordem na saída)."""
+    todo = [u for u in urls if u]
+    if len(todo) < 2:
+        return [ensure_pdf_url(u) for u in urls]
+    with ThreadPoolExecutor(max_workers=len(todo)) as ex:
+        return list(ex.map(ensure_pdf_url, urls))
+
+
+def _pdfium_text(pdf_bytes: bytes, max_pages: int = PDF_MAX_PAGES) -> str:
+    """Texto das primeiras páginas via pypdfium2 (se instalado); "" em qualquer falha."""
+    try:
+        import pypdfium2 as pdfium  # type: ignore
+    except Exception:
+        return ""
+    try:
+        pdf = pdfium.PdfDocument(pdf_bytes)
+        try:
+            parts = []
+            for i in range(min(len(pdf), max_pages)):
+                page = pdf[i]
+                textpage = page.get_textpage()
+                parts.append(textpage.get_text_range())
+                textpage.close()
+                page.close()
+        finally:
+            pdf.close()
+        return "\n".join(parts).replace("\r\n", "\n")
+    except Exception:
+        return ""
+
+
+def _pypdf_text(pdf_bytes: bytes, max_pages: int = PDF_MAX_PAGES) -> str:
+    """Texto das primeiras páginas via pypdf (puro Python, se instalado); "" em qualquer falha."""
+    try:
+        from pypdf import PdfReader  # type: ignore
+    except Exception:
+        return ""
+    try:
+        reader = PdfReader(io.BytesIO(pdf_bytes))
+        return "\n".join(page.extract_text() or "" for page in reader.pages[:max_pages])
+    except Exception:
+        return ""
+
+
+def _pdf_to_text(pdf_bytes: bytes, token: Optional[str]) -> Tuple[str, bool]:
+    """
+    pdf_to_text + se o texto é definitivo (pode ir para o cache em disco).
+
+    Definitivo = veio do ConvertAPI ou tem ao menos PDF_MIN_TEXT_CHARS. Texto curto sem
+    token/com falha do ConvertAPI (PDF escaneado?) não é: outra execução pode conseguir mais.
+    """
+    local = _pdfium_text(pdf_bytes) or _pypdf_text(pdf_bytes)
+    if len(local.strip()) >= PDF_MIN_TEXT_CHARS:
+        return local, True
     if token:
         try:
             url = "https://v2.convertapi.com/convert/pdf/to/txt"
             files = {"File": ("edital.pdf", pdf_bytes, "application/pdf")}
             headers = {"Authorization": f"Bearer {token}"}
             data = {"StoreFile": "false"}
-            r = requests.post(url, headers=headers, files=files, data=data, timeout=120)
+            r = SESSION.post(url, headers=headers, files=files, data=data, timeout=120)
             r.raise_for_status()
-            return r.text or ""
+            return r.text or "", True
         except Exception:
             pass
     try:
         from pdfminer.high_level import extract_text
-        return extract_text(io.BytesIO(pdf_bytes)) or ""
+        txt = extract_text(io.BytesIO(pdf_bytes)) or local
     except Exception:
-        return ""
+        txt = local
+    return txt, len(txt.strip()) >= PDF_MIN_TEXT_CHARS
+
+
+def pdf_to_text(pdf_bytes: bytes, token: Optional[str]) -> str:
+    """Extrai local (pypdfium2, senão pypdf); se vier pouco texto, tenta ConvertAPI e depois pdfminer.six."""
+    return _pdf_to_text(pdf_bytes, token)[0]
+
+
+def _first_pattern_in(patterns: List[re.Pattern], anchors: Tuple[str, ...],
+                      texts: List[Tuple[str, str]]) -> Optional[str]:
+    """pick_first respeitando a prioridade dos padrões: cada padrão em todos os textos antes do próximo."""
+    texts = [(t, cf) for t, cf in texts if t and any(a in cf for a in anchors)]
+    for pat in patterns:
+        for text, _ in texts:
+            found = pick_first(text, [pat])
+            if found:
+                return found
+    return None
+
+
+def _first_in(rx: Any, anchors: Tuple[str, ...], texts: List[Tuple[str, str]]) -> Optional[str]:
+    """pick_fused em cada (texto, casefold) na ordem; para no primeiro que achar."""
+    for text, text_cf in texts:
+        found = pick_fused(text, rx, anchors, text_cf)
+        if found:
+            return found
+    return None
+
+
+def _prune_pdftext(folder: str, keep: int = PDF_TEXT_CACHE_MAX) -> None:
+    """Remove os .txt menos usados além de `keep` (o mtime é renovado a cada leitura)."""
+    try:
+        entries = [e for e in os.scandir(folder) if e.name.endswith(".txt")]
+        if len(entries) <= keep:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+    except OSError:
+        return
+    for e in entries[:-keep]:
+        try:
+            os.remove(e.path)
+        except OSError:
+            pass
+
+
+def pdf_to_text_cached(pdf_bytes: bytes, token: Optional[str], cache_dir: str = "") -> str:
+    """pdf_to_text com cache em disco por conteúdo (<cache_dir>/pdftext/<sha256>.txt); sem cache_dir, direto."""
+    if not cache_dir:
+        return pdf_to_text(pdf_bytes, token)
+    folder = os.path.join(cache_dir, "pdftext")
+    path = os.path.join(folder, hashlib.sha256(pdf_bytes).hexdigest() + ".txt")
+    try:
+        with open(path, encoding="utf-8") as f:
+            txt = f.read()
+        try:
+            os.utime(path)  # uso recente (LRU)
+        except OSError:
+            pass
+        return txt
+    except OSError:
+        pass
+    txt, definitivo = _pdf_to_text(pdf_bytes, token)
+    if definitivo and txt:  # texto curto/degradado (ex.: escaneado sem ConvertAPI) não fica em cache
+        try:
+            os.makedirs(folder, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(txt)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+        _prune_pdftext(folder)
+    return txt
 
 
 def extract_fields_from_pdf_text(edital_txt: str, anexo_txt: str) -> Dict[str, Any]:
-    full = (edital_txt or "") + "\n\n" + (anexo_txt or "")
-    valor_str = pick_first(full, PDF_PATTERNS_VALOR)
+    # edital primeiro, anexo só se preciso (sem concatenar os dois textos)
+    edital = (edital_txt or "", (edital_txt or "").casefold())
+    texts = [edital, (anexo_txt or "", (anexo_txt or "").casefold())]
+    valor_str = _first_pattern_in(PDF_PATTERNS_VALOR, PDF_VALOR_ANCHORS, texts)
     valor = money_br_to_number(valor_str)
-    objeto = pick_first(edital_txt, PDF_PATTERNS_OBJETO)
-    abertura = pick_first(full, PDF_PATTERNS_ABERTURA)
-    encerramento = pick_first(full, PDF_PATTERNS_ENCERRAMENTO)
+    objeto = _first_in(PDF_OBJETO_RX, PDF_OBJETO_ANCHORS, [edital])
+    abertura = _first_in(PDF_ABERTURA_RX, PDF_ABERTURA_ANCHORS, texts)
+    encerramento = _first_in(PDF_ENCERRAMENTO_RX, PDF_ENCERRAMENTO_ANCHORS, texts)
     return {
         "objetoCompra": objeto,
         "valorEstimado": valor,
@@ -411,7 +755,7 @@ def extract_fields_from_pdf_text(edital_txt: str, anexo_txt: str) -> Dict[str, A
 # ======================= Valor por HTML/JSON =======================
 
 def extract_value_from_html(html: str) -> Optional[float]:
-    soup = BeautifulSoup(html, "html.parser")
+    soup = BeautifulSoup(html, HTML_PARSER)
     for tag in soup(["script", "style"]):
         tag.decompose()
     text = soup.get_text("\n", strip=True)
@@ -436,7 +780,7 @@ def probe_json_endpoints(html: str, base_url: str) -> Optional[float]:
         urls.add(m.group(0))
     for u in list(urls)[:10]:
         try:
-            r = requests.get(u, timeout=20)
+            r = SESSION.get(u, timeout=20)
             j = r.json()
             stack = [j]
             while stack:
@@ -506,7 +850,7 @@ def _parse_info_gerais_for_valor(s: str) -> Optional[float]:
 
 def valor_from_dados_abertos(r: Resultado, session: Optional[requests.sessions.Session] = None) -> Optional[float]:
     """Tenta obter valor estimado usando Compras/Dados Abertos."""
-    sess = session or requests.Session()
+    sess = session or SESSION
     uasg = (r.unidade.codigo or "").strip()
     num_aviso = _fmt_numero_aviso(r.numeroCompra, r.anoCompra)
     if not uasg:
@@ -634,17 +978,17 @@ def call_openai_summary(data_for_ai: Dict[str, Any], api_key: str) -> Dict[str,
         "temperature": 0,
         "messages": [
             {"role": "system", "content": system},
-            {"role": "user", "content": json.dumps({"filtros": data_for_ai.get("filtros"), "itens": itens}, ensure_ascii=False)}
+            {"role": "user", "content": json_dumps_bytes({"filtros": data_for_ai.get("filtros"), "itens": itens}).decode("utf-8")}
         ],
         "response_format": {"type": "json_object"}
     }
 
-    r = requests.post(url, headers=headers, json=body, timeout=120)
+    r = SESSION.post(url, headers=headers, data=json_dumps_bytes(body), timeout=120)
     r.raise_for_status()
-    jr = r.json()
+    jr = json_loads(r.content)
     content = jr["choices"][0]["message"]["content"]
     try:
-        return json.loads(content)
+        return json_loads(content)
     except Exception:
         return {"resumo": {"executivo": content}}
 
@@ -660,9 +1004,45 @@ def key_candidates_for(r: Resultado) -> List[str]:
     return [k for k in keys if k]
 
 
-def resolve_ai_item(ai: Dict[str, Any], r: Resultado) -> Optional[Dict[str, Any]]:
+def build_ai_index(por_item: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Índice de ai["por_item"] para resolve_ai_item: chaves exatas via o próprio dict e,
+    para a busca por substring do numeroCompra, todas as chaves numa string só
+    (separadas por \\x00) + offsets de início (bisect acha a chave do match).
+    """
+    keys = list(por_item)
+    starts, pos = [], 0
+    for k in keys:
+        starts.append(pos)
+        pos += len(str(k)) + 1
+    return {"por_item": por_item, "keys": keys, "starts": starts, "joined": "\x00".join(str(k) for k in keys)}
+
+
+def _ai_index_add(idx: Dict[str, Any], key: str, entry: Dict[str, Any]) -> None:
+    idx["por_item"][key] = entry
+    idx["keys"].append(key)
+    if idx["starts"]:
+        idx["starts"].append(len(idx["joined"]) + 1)
+        idx["joined"] += "\x00" + key
+    else:
+        idx["starts"].append(0)
+        idx["joined"] = key
+
+
+def resolve_ai_item(ai: Dict[str, Any], r: Resultado, idx: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
     if not ai:
         return None
+    if idx is not None:
+        por_item = idx["por_item"]
+        for k in key_candidates_for(r):
+            if k in por_item:
+                return por_item[k]
+        if r.numeroCompra:
+            # primeira chave (na ordem do dict) que contém o número
+            pos = idx["joined"].find(str(r.numeroCompra))
+            if pos >= 0:
+                return por_item[idx["keys"][bisect.bisect_right(idx["starts"], pos) - 1]]
+        return None
     por_item = ai.get("por_item") or {}
     for k in key_candidates_for(r):
         if k in por_item:
@@ -678,32 +1058,43 @@ def _human_val_txt(v: Optional[float]) -> str:
     return fmt_money_br(v) if v is not None else "—"
 
 
+def _kw_rx(words: List[str]) -> re.Pattern:
+    """Lista de palavras -> uma alternância (equivale a any(w in texto))."""
+    return re.compile("|".join(re.escape(w) for w in words))
+
+
+# pontos positivos padrão por palavras do objeto (texto já em minúsculas)
+AI_POSITIVOS_POR_PALAVRA = (
+    (_kw_rx(["merenda", "alimento", "escola"]), ["Demanda recorrente (rede escolar)", "Entrega fracionada facilita logística"]),
+    (_kw_rx(["ti", "informát", "informat"]), ["Ampla oferta de marcas e insumos", "Distribuição simplificada"]),
+    (_kw_rx(["obra", "engenharia", "manutenção predial"]), ["Escopo padronizado no edital", "Cronograma definido"]),
+)
+
+
 def ensure_ai_defaults(ai: Optional[Dict[str, Any]], resultados: List[Resultado]) -> Dict[str, Any]:
     ai = ai or {}
     ai.setdefault("por_item", {})
-    por_item = ai["por_item"]
+    idx = build_ai_index(ai["por_item"])
 
     for r in resultados:
-        entry = resolve_ai_item(ai, r)
+        entry = resolve_ai_item(ai, r, idx)
         if not entry:
             key = r.numeroControlePNCP or (f"{r.numeroCompra}/{r.anoCompra}" if r.numeroCompra else None)
             if not key:
                 continue
             entry = {}
-            por_item[str(key)] = entry
+            _ai_index_add(idx, str(key), entry)
 
         entry.setdefault("titulo", (r.objetoCompra or "Licitação"))
         entry.setdefault("valor_estimado_texto", _human_val_txt(r.valorEstimado))
 
         if not entry.get("pontos_positivos"):
-            obj = (r.objetoCompra or "").lower()
             pos = []
-            if any(x in obj for x in ["merenda", "alimento", "escola"]):
-                pos += ["Demanda recorrente (rede escolar)", "Entrega fracionada facilita logística"]
-            if any(x in obj for x in ["ti", "informát", "informat"]):
-                pos += ["Ampla oferta de marcas e insumos", "Distribuição simplificada"]
-            if any(x in obj for x in ["obra", "engenharia", "manutenção predial"]):
-                pos += ["Escopo padronizado no edital", "Cronograma definido"]
+            if r.objetoCompra:  # objeto vazio não casa nenhum grupo
+                obj = r.objetoCompra.lower()
+                for rx, frases in AI_POSITIVOS_POR_PALAVRA:
+                    if rx.search(obj):
+                        pos += frases
             if not pos:
                 pos = ["Escopo com boa previsibilidade", "Regras objetivas no edital"]
             entry["pontos_positivos"] = pos[:3]
@@ -732,8 +1123,9 @@ def ensure_ai_metrics(ai: Dict[str, Any], resultados: List[Resultado]) -> Dict[s
         m["total"] = len(resultados)
 
     counts = {"prosseguir": 0, "avaliar": 0, "descartar": 0}
+    idx = build_ai_index(ai.get("por_item") or {})
     for r in resultados:
-        per = resolve_ai_item(ai, r)
+        per = resolve_ai_item(ai, r, idx)
         rec = (per or {}).get("recomendacao") or (r.analise or {}).get("recomendacao")
         if rec in counts:
             counts[rec] += 1
@@ -772,27 +1164,49 @@ def prazo_risco(i: Resultado) -> str:
 
 # ======================= HTML =======================
 
-def build_html(resultados: List[Resultado], filtros: Dict[str, Any], ai: Optional[Dict[str, Any]]) -> str:
-    estilo = """
-    body{font-family:Arial,Helvetica,sans-serif;padding:24px;color:#111}
-    h1{margin:0 0 8px 0;font-size:22px}
-    h3{margin:10px 0 8px}
-    .sub{color:#666;margin:0 0 24px 0}
-    .card{border:1px solid #ddd;border-radius:10px;margin:18px 0;overflow:hidden}
-    .hd{background:#fafafa;border-bottom:1px solid #eee;padding:16px}
-    .sec{padding:16px}
-    .grid{display:grid;grid-template-columns: 240px 1fr;gap:8px 16px}
-    .lab{color:#555}
-    .val{font-weight:600}
-    ul{margin:8px 0 0 18px}
-    .muted{color:#777}
-    .pill{display:inline-block;padding:2px 8px;border-radius:999px;background:#eef;border:1px solid #dde;margin-left:8px;font-size:12px}
-    .small{font-size:12px}
-    .hr{height:1px;background:#eee;margin:14px 0}
-    .featured{border-color:#4f46e5; box-shadow:0 0 0 2px rgba(79,70,229,.15)}
-    .ribbon{display:inline-block;background:#4f46e5;color:#fff;border-radius:999px;padding:2px 10px;font-size:12px;margin-left:8px}
-    """
+# cabeçalho/rodapé fixos do relatório, montados uma vez no import
+HTML_STYLE = """
+body{font-family:Arial,Helvetica,sans-serif;padding:24px;color:#111}
+h1{margin:0 0 8px 0;font-size:22px}
+h3{margin:10px 0 8px}
+.sub{color:#666;margin:0 0 24px 0}
+.card{border:1px solid #ddd;border-radius:10px;margin:18px 0;overflow:hidden}
+.hd{background:#fafafa;border-bottom:1px solid #eee;padding:16px}
+.sec{padding:16px}
+.grid{display:grid;grid-template-columns: 240px 1fr;gap:8px 16px}
+.lab{color:#555}
+.val{font-weight:600}
+ul{margin:8px 0 0 18px}
+.muted{color:#777}
+.pill{display:inline-block;padding:2px 8px;border-radius:999px;background:#eef;border:1px solid #dde;margin-left:8px;font-size:12px}
+.small{font-size:12px}
+.hr{height:1px;background:#eee;margin:14px 0}
+.featured{border-color:#4f46e5; box-shadow:0 0 0 2px rgba(79,70,229,.15)}
+.ribbon{display:inline-block;background:#4f46e5;color:#fff;border-radius:999px;padding:2px 10px;font-size:12px;margin-left:8px}
+"""
+HTML_HEAD = f"""<!doctype html>
+<html lang="pt-BR">
+<head>
+  <meta charset="utf-8">
+  <title>Relatório de Licitações</title>
+  <style>{HTML_STYLE}</style>
+</head>
+<body>
+  <h1>Relatório de Licitações</h1>
+  """
+HTML_TAIL = """
+</body>
+</html>
+"""
+# esqueleto de cada card; os blocos já chegam escapados (format_map não reinterpreta os valores)
+CARD_TMPL = (
+    '\n            <div class="card {cls}">\n'
+    '{header}{ident}<div class="hr"></div>{objeto}<div class="hr"></div>{fixos}<div class="hr"></div>{prazos}{ai}'
+    '\n            </div>\n'
+)
 
+
+def build_html(resultados: List[Resultado], filtros: Dict[str, Any], ai: Optional[Dict[str, Any]]) -> str:
     def ai_card_top(ai_block: Dict[str, Any]) -> str:
         if not ai_block:
             return ""
@@ -824,7 +1238,7 @@ def build_html(resultados: List[Resultado], filtros: Dict[str, Any], ai: Optiona
     def ai_block_for_item(ai_block: Dict[str, Any], r: Resultado) -> str:
         if not ai_block:
             return ""
-        per = resolve_ai_item(ai_block, r)
+        per = resolve_ai_item(ai_block, r, ai_idx)
         if not per:
             return ""
         pos = "".join(f"<li>{esc_html(x)}</li>" for x in (per.get("pontos_positivos") or []))
@@ -874,7 +1288,7 @@ def build_html(resultados: List[Resultado], filtros: Dict[str, Any], ai: Optiona
                 return idx
         return None
 
-    def header_card(i: Resultado) -> str:
+    def header_card(i: Resultado, banner: str = "") -> str:
         titulo = "Análise Detalhada da Licitação"
         numero = f"{i.numeroCompra}/{i.anoCompra or ''}".rstrip("/") if i.numeroCompra else (i.numeroControlePNCP or "—")
         valor = fmt_money_br(i.valorEstimado)
@@ -882,7 +1296,7 @@ def build_html(resultados: List[Resultado], filtros: Dict[str, Any], ai: Optiona
         link = f'<div class="small"><a href="{esc_html(i.linkSistemaOrigem)}" target="_blank" rel="noopener">Sistema de origem</a></div>' if i.linkSistemaOrigem else ""
         return f"""
         <div class="hd">
-          <h1>{esc_html(titulo)}</h1>
+          <h1>{esc_html(titulo)}</h1> {banner}
           <div class="sub">Identificação do Certame • Nº {esc_html(numero)} {situacao}</div>
           <div><b>Valor Estimado:</b> {valor}</div>
           {link}
@@ -973,26 +1387,25 @@ def build_html(resultados: List[Resultado], filtros: Dict[str, Any], ai: Optiona
         </div>
         """
 
-    def render_card(i: Resultado, ai_b: Dict[str, Any], destacado: bool = False) -> str:
-        banner = '<span class="ribbon">Destaque IA</span>' if destacado else ''
-        return f"""
-            <div class="card {'featured' if destacado else ''}">
-              {header_card(i).replace('</h1>', f'</h1> {banner}', 1)}
-              {bloco_ident(i)}
-              <div class="hr"></div>
-              {bloco_objeto(i)}
-              <div class="hr"></div>
-              {bloco_requisitos()}
+    # blocos fixos: iguais em todo card, montados uma vez por relatório
+    blocos_fixos = f"""{bloco_requisitos()}
               <div class="hr"></div>
               {bloco_habilitacao()}
               <div class="hr"></div>
-              {bloco_viabilidade()}
-              <div class="hr"></div>
-              {bloco_prazos(i)}
-              {ai_block_for_item(ai_b, i)}
-            </div>
-        """
+              {bloco_viabilidade()}"""
 
+    def render_card(i: Resultado, ai_b: Dict[str, Any], destacado: bool = False) -> str:
+        return CARD_TMPL.format_map({
+            "cls": "featured" if destacado else "",
+            "header": header_card(i, '<span class="ribbon">Destaque IA</span>' if destacado else ''),
+            "ident": bloco_ident(i),
+            "objeto": bloco_objeto(i),
+            "fixos": blocos_fixos,
+            "prazos": bloco_prazos(i),
+            "ai": ai_block_for_item(ai_b, i),
+        })
+
+    ai_idx = build_ai_index(ai.get("por_item") or {}) if ai else None
     top_ai_html = ai_card_top(ai) if ai else ""
     featured_idx = match_ai_featured(ai, resultados) if ai else None
     cards_html: List[str] = []
@@ -1003,21 +1416,8 @@ def build_html(resultados: List[Resultado], filtros: Dict[str, Any], ai: Optiona
             continue
         cards_html.append(render_card(r, ai, destacado=False))
 
-    html = f"""<!doctype html>
-<html lang="pt-BR">
-<head>
-  <meta charset="utf-8">
-  <title>Relatório de Licitações</title>
-  <style>{estilo}</style>
-</head>
-<body>
-  <h1>Relatório de Licitações</h1>
-  {top_ai_html}
-  {''.join(cards_html) if cards_html else '<p class="muted">Nenhum resultado.</p>'}
-</body>
-</html>
-"""
-    return html
+    return "".join((HTML_HEAD, top_ai_html, "\n  ",
+                    "".join(cards_html) if cards_html else '<p class="muted">Nenhum resultado.</p>', HTML_TAIL))
 
 
 # ======================= Conversão HTML -> PDF =======================
@@ -1027,145 +1427,329 @@ def html_to_pdf_via_convertapi(html: str, token: str) -> bytes:
     headers = {"Authorization": f"Bearer {token}", "Accept": "application/octet-stream"}
     files = {"File": ("index.html", html.encode("utf-8"), "text/html; charset=utf-8")}
     data = {"StoreFile": "false"}
-    r = requests.post(url, headers=headers, files=files, data=data, timeout=180)
+    r = SESSION.post(url, headers=headers, files=files, data=data, timeout=180)
     r.raise_for_status()
     return r.content
 
 
-# ======================= Main =======================
+# ======================= Enriquecimento =======================
 
-def main():
-    p = argparse.ArgumentParser(description="Gerador de relatório de licitações (PNCP)")
-    p.add_argument("--api-key", default="", help="Chave local opcional (simula x-api-key do n8n).")
-    p.add_argument("--openai-key", default=os.getenv("OPENAI_API_KEY", ""), help="OpenAI API key")
-    p.add_argument("--convertapi-token", default=os.getenv("CONVERTAPI_TOKEN", ""), help="Token ConvertAPI")
-    p.add_argument("--palavra", default="")
-    p.add_argument("--uf", default="")
-    p.add_argument("--orgao", default="")
-    p.add_argument("--min-valor", default="0")
-    p.add_argument("--ai", type=int, default=0)
-    p.add_argument("--pdf", type=int, default=0)
-    p.add_argument("--data-inicial", default="20250713")
-    p.add_argument("--data-final", default="20250812")
-    p.add_argument("--modalidade", default="")
-    p.add_argument("--cod-modalidade", default="")
-    p.add_argument("--modo-disputa", default="")
-    p.add_argument("--tamanho-pagina", type=int, default=50)
-    p.add_argument("--filename", default="licitacoes.pdf")
-    p.add_argument("--extract-pdf", type=int, default=1, help="Extrair texto de PDF (1/0). Requer CONVERTAPI_TOKEN para o caminho ConvertAPI; sem ele, tenta pdfminer.")
-    args = p.parse_args()
+ENRICH_WORKERS = 8  # resultados enriquecidos em paralelo (I/O: página, PDFs, ConvertAPI)
+PAGE_MAX_BYTES = 2_000_000  # página de origem: os links úteis estão no começo; o resto é descartado
+PDF_MAX_BYTES = 25_000_000  # edital/anexo maior que isso não é baixado nem enviado ao ConvertAPI
+
+
+def read_capped_text(resp: requests.Response, limit: int = PAGE_MAX_BYTES) -> str:
+    """Lê no máximo `limit` bytes de uma resposta em stream e decodifica (sem baixar o resto)."""
+    buf, total = [], 0
+    for chunk in resp.iter_content(65536):
+        buf.append(chunk)
+        total += len(chunk)
+        if total >= limit:
+            break
+    raw = b"".join(buf)[:limit]
+    try:
+        return raw.decode(resp.encoding or "utf-8", errors="replace")
+    except LookupError:
+        return raw.decode("utf-8", errors="replace")
+
+
+def fetch_pdf_bytes(url: str, limit: int = PDF_MAX_BYTES) -> bytes:
+    """Baixa o PDF em stream; acima de `limit` bytes (Content-Length ou contagem) desiste com ValueError."""
+    resp = SESSION.get(url, stream=True, timeout=120)
+    try:
+        resp.raise_for_status()
+        size = resp.headers.get("Content-Length") or ""
+        if size.isdigit() and int(size) > limit:
+            raise ValueError(f"PDF muito grande ({int(size)} bytes), ignorado: {url}")
+        buf, total = [], 0
+        for chunk in resp.iter_content(65536):
+            buf.append(chunk)
+            total += len(chunk)
+            if total > limit:
+                raise ValueError(f"PDF muito grande (>{limit} bytes), ignorado: {url}")
+        return b"".join(buf)
+    finally:
+        resp.close()
+
+
+def pdf_text_per_url(token: str, cache_dir: str = "") -> Callable[[str], str]:
+    """
+    fetch_pdf_bytes + pdf_to_text_cached uma vez por URL no lote.
+
+    Portais repetem o mesmo edital em vários itens; quem pede uma URL já em andamento
+    espera o primeiro download (entre threads) em vez de baixar de novo. Falhas também
+    são compartilhadas (a exceção é relançada para cada chamador).
+    """
+    lock = threading.Lock()
+    futs: Dict[str, Future] = {}
+
+    def get(url: str) -> str:
+        with lock:
+            fut = futs.get(url)
+            owner = fut is None
+            if owner:
+                fut = futs[url] = Future()
+        if owner:
+            try:
+                fut.set_result(pdf_to_text_cached(fetch_pdf_bytes(url), token, cache_dir))
+            except Exception as e:
+                fut.set_exception(e)
+        return fut.result()
+
+    return get
+
+
+def _enrich_result(r: Resultado, token: str, log, cache_dir: str = "",
+                   pdf_text: Optional[Callable[[str], str]] = None) -> None:
+    """
+    Página de origem -> PDFs -> texto -> campos; fallbacks HTML/JSON e Dados Abertos. Altera `r`.
+
+    `pdf_text` (de pdf_text_per_url) deduplica downloads entre resultados do mesmo lote.
+    """
+    link = normalize_url(r.linkSistemaOrigem or "")
+    edital_url = None
+    anexo_url = None
+    page_html = ""
+
+    if link.lower().endswith(".pdf"):
+        edital_url = link  # link direto para o PDF: não há página para baixar
+    elif link:
+        try:
+            html_r = SESSION.get(link, stream=True, timeout=40)
+            try:
+                if html_r.ok:
+                    page_html = read_capped_text(html_r)
+            finally:
+                html_r.close()
+            if page_html:
+                ed, an = find_pdf_links(link, page_html)
+                edital_url, anexo_url = ensure_pdf_urls([ed, an])
+        except Exception as e:
+            log(f"[aviso] Falha ao baixar/parsear página origem: {e}")
+
+    # PDF -> texto (edital/anexo)
+    if (edital_url or anexo_url) and (token or True):
+        def pdf_txt(url: Optional[str], nome: str) -> str:
+            if not url:
+                return ""
+            try:
+                if pdf_text is not None:
+                    return pdf_text(url)
+                return pdf_to_text_cached(fetch_pdf_bytes(url), token, cache_dir)
+            except Exception as e:
+                log(f"[aviso] Falha pdf->txt ({nome}): {e}")
+                return ""
+
+        if edital_url and anexo_url:
+            # downloads independentes: o anexo vai em paralelo ao edital
+            with ThreadPoolExecutor(max_workers=1) as ex:
+                fut_anexo = ex.submit(pdf_txt, anexo_url, "anexo")
+                edital_txt = pdf_txt(edital_url, "edital")
+                anexo_txt = fut_anexo.result()
+        else:
+            edital_txt = pdf_txt(edital_url, "edital")
+            anexo_txt = pdf_txt(anexo_url, "anexo")
+
+        extracted = extract_fields_from_pdf_text(edital_txt, anexo_txt)
+        if extracted.get("objetoCompra"):
+            r.objetoCompra = extracted["objetoCompra"]
+        if extracted.get("valorEstimado") is not None:
+            r.valorEstimado = extracted["valorEstimado"]
+        obs = extracted.get("obsPrazosPdf") or {}
+        if obs.get("abertura") and not r.dataAberturaProposta:
+            r.dataAberturaProposta = obs["abertura"]
+        if obs.get("encerramento") and not r.dataEncerramentoProposta:
+            r.dataEncerramentoProposta = obs["encerramento"]
+
+    # Fallback: HTML/JSON
+    if r.valorEstimado is None and page_html:
+        try:
+            v_html = get_best_value_from_page(page_html, link)
+            if v_html is not None:
+                r.valorEstimado = v_html
+        except Exception as e:
+            log(f"[aviso] Falha ao extrair valor do HTML/JSON: {e}")
+
+    log(f"[depuracao] {r.numeroCompra}/{r.anoCompra}: link={link} edital={edital_url} anexo={anexo_url} valor={r.valorEstimado}")
+
+    # Dados Abertos (última tentativa estruturada)
+    if r.valorEstimado is None:
+        try:
+            v_da = valor_from_dados_abertos(r)
+            if v_da is not None:
+                r.valorEstimado = v_da
+        except Exception as e:
+            log(f"[aviso] Dados Abertos falhou: {e}")
+
+
+# ======================= Geração =======================
+
+class ReportError(Exception):
+    """Falha na geração do relatório; `code` é o código de saída usado pela CLI."""
+
+    def __init__(self, message: str, code: int = 1, logs: str = "", html: Optional[bytes] = None):
+        super().__init__(message)
+        self.code = code
+        self.logs = logs
+        self.html = html  # HTML já montado quando a falha é na etapa do PDF (a CLI grava mesmo assim)
+
+
+@dataclass
+class ReportBundle:
+    html: bytes
+    json: bytes
+    pdf: Optional[bytes]
+    logs: str
+    degraded: bool = False  # saiu com falha parcial (IA, HTML): quem guarda em cache deve pular
+
+
+WARM_HOSTS = ("pncp.gov.br", "api.openai.com", "v2.convertapi.com")
+
+
+def _warm_tls() -> None:
+    """Abre as conexões TLS com os hosts usados e as deixa no pool do SESSION."""
+    for host in WARM_HOSTS:
+        try:
+            SESSION.head(f"https://{host}/", timeout=3, allow_redirects=False)
+        except Exception:
+            pass
+
+
+def warmup() -> None:
+    """Pré-carrega dependências opcionais pesadas e aquece o TLS (início de cada processo de relatório)."""
+    threading.Thread(target=_warm_tls, daemon=True).start()
+    for mod in ("pypdfium2", "pypdf", "pdfminer.high_level"):
+        try:
+            __import__(mod)
+        except Exception:
+            pass
+
+
+def report_worker(params: Dict[str, Any], conn: Any) -> None:
+    """Alvo do processo de relatório do app: manda ("ok", ReportBundle) ou ("erro", ReportError) por `conn`."""
+    warmup()
+    try:
+        result: Tuple[str, Any] = ("ok", generate_report(params))
+    except ReportError as e:  # generate_report converte qualquer outra falha em ReportError
+        result = ("erro", e)
+    try:
+        conn.send(result)
+    finally:
+        conn.close()
+
+
+def report_json_bytes(filtros: Dict[str, Any], resultados: List[Resultado], ai_block: Optional[Dict[str, Any]]) -> bytes:
+    """Mesmo texto de json.dumps(..., indent=2) do relatório, serializando um resultado por vez."""
+    def dump(obj: Any, pad: str) -> str:
+        return json.dumps(obj, ensure_ascii=False, indent=2).replace("\n", "\n" + pad)
+
+    parts = ['{\n  "filtros": ', dump(filtros, "  "), f',\n  "total": {len(resultados)},\n  "resultados": ']
+    if resultados:
+        parts.append("[\n    " + ",\n    ".join(dump(asdict(r), "    ") for r in resultados) + "\n  ]")
+    else:
+        parts.append("[]")
+    parts += [',\n  "ai": ', dump(ai_block, "  "), "\n}"]
+    return "".join(parts).encode("utf-8")
+
+
+def generate_report(params: Dict[str, Any]) -> ReportBundle:
+    """
+    Roda consulta + enriquecimento + IA e devolve os artefatos em memória.
+
+    `params` usa os nomes dos argumentos da CLI (data_inicial, min_valor, openai_key, ...);
+    chaves ausentes assumem os mesmos defaults da CLI.
+    """
+    logs = io.StringIO()
+
+    def log(msg: str) -> None:
+        print(msg, file=sys.stderr)
+        logs.write(msg + "\n")
+
+    try:
+        html, json_bytes, pdf_bytes, degraded = _generate(params, log)
+    except ReportError as e:
+        e.logs = logs.getvalue()
+        raise
+    except Exception as e:
+        # erro inesperado (ex.: HTTP do PNCP): traceback vai para os logs devolvidos
+        log(traceback.format_exc().rstrip())
+        raise ReportError(f"{type(e).__name__}: {e}", code=1, logs=logs.getvalue()) from e
+    return ReportBundle(html=html.encode("utf-8"), json=json_bytes, pdf=pdf_bytes, logs=logs.getvalue(),
+                        degraded=degraded)
+
+
+def _generate(params: Dict[str, Any], log) -> Tuple[str, bytes, Optional[bytes], bool]:
+    openai_key = params.get("openai_key") or os.getenv("OPENAI_API_KEY", "")
+    convertapi_token = params.get("convertapi_token") or os.getenv("CONVERTAPI_TOKEN", "")
+    min_valor = params.get("min_valor", "0")
 
     try:
-        cod_modalidade = resolve_modalidade_code(args.modalidade, args.cod_modalidade)
+        cod_modalidade = resolve_modalidade_code(params.get("modalidade", ""), params.get("cod_modalidade", ""))
     except Exception as e:
-        print(f"[erro] {e}", file=sys.stderr)
-        sys.exit(2)
+        log(f"[erro] {e}")
+        raise ReportError(str(e), code=2)
 
     filtros = {
-        "palavra": args.palavra,
-        "uf": (args.uf or "").upper(),
-        "orgao": args.orgao,
-        "minValor": float(args.min_valor) if str(args.min_valor).strip() else 0.0,
+        "palavra": params.get("palavra", ""),
+        "uf": (params.get("uf") or "").upper(),
+        "orgao": params.get("orgao", ""),
+        "minValor": float(min_valor) if str(min_valor).strip() else 0.0,
         "codModalidade": cod_modalidade,
-        "tamanhoPagina": clamp_tamanho_pagina(args.tamanho_pagina),
+        "tamanhoPagina": clamp_tamanho_pagina(params.get("tamanho_pagina", 50)),
     }
 
     query = {
-        "dataInicial": args.data_inicial,
-        "dataFinal": args.data_final,
+        "dataInicial": params.get("data_inicial", "20250713"),
+        "dataFinal": params.get("data_final", "20250812"),
         "codModalidade": cod_modalidade,
-        "modoDisputa": args.modo_disputa or None,
+        "modoDisputa": params.get("modo_disputa") or None,
         "uf": filtros["uf"] or None,
         "tamanhoPagina": filtros["tamanhoPagina"],
     }
 
-    print("[info] Consultando PNCP...", file=sys.stderr)
+    log("[info] Consultando PNCP...")
     resp = fetch_pncp(query)
     arr = resp["arr"]
     resultados = normalize_results(arr, filtros)
 
-    ai_payload = {"total": len(resultados), "resultados": [asdict(r) for r in resultados], "filtros": filtros}
+    # snapshot para a IA (dados do PNCP, antes do enriquecimento); só monta se a IA vai rodar
+    usar_ai = bool(parse_flag(params.get("ai", 0)) and openai_key)
+    ai_payload = (
+        {"total": len(resultados), "resultados": [asdict(r) for r in resultados], "filtros": filtros}
+        if usar_ai else None
+    )
 
-    token = os.getenv("CONVERTAPI_TOKEN", args.convertapi_token) if args.extract_pdf else ""
+    token = convertapi_token if parse_flag(params.get("extract_pdf", 1)) else ""
+    cache_dir = params.get("cache_dir") or ""
 
-    for r in resultados:
-        link = normalize_url(r.linkSistemaOrigem or "")
-        edital_url = None
-        anexo_url = None
-        page_html = ""
+    pdf_text = pdf_text_per_url(token, cache_dir)  # mesmo PDF em vários resultados: baixa uma vez
 
-        if link:
-            try:
-                html_r = requests.get(link, timeout=40)
-                if html_r.ok:
-                    page_html = html_r.text
-                    ed, an = find_pdf_links(link, page_html)
-                    edital_url = ensure_pdf_url(ed)
-                    anexo_url = ensure_pdf_url(an)
-            except Exception as e:
-                print(f"[aviso] Falha ao baixar/parsear página origem: {e}", file=sys.stderr)
+    # cada resultado loga num buffer próprio; a saída segue a ordem dos resultados
+    # [depuracao] (uma linha por resultado) só com --debug 1
+    debug = parse_flag(params.get("debug", 0))
 
-        if not edital_url and link.lower().endswith(".pdf"):
-            edital_url = link
+    def _run(r: Resultado) -> List[str]:
+        buf: List[str] = []
+        _enrich_result(r, token, buf.append, cache_dir, pdf_text)
+        return buf if debug else [m for m in buf if not m.startswith("[depuracao]")]
 
-        # PDF -> texto (edital/anexo)
-        if (edital_url or anexo_url) and (token or True):
-            edital_txt = ""
-            anexo_txt = ""
-            try:
-                if edital_url:
-                    pr = requests.get(edital_url, timeout=120)
-                    pr.raise_for_status()
-                    edital_txt = pdf_to_text(pr.content, token)
-            except Exception as e:
-                print(f"[aviso] Falha pdf->txt (edital): {e}", file=sys.stderr)
-            try:
-                if anexo_url:
-                    pr = requests.get(anexo_url, timeout=120)
-                    pr.raise_for_status()
-                    anexo_txt = pdf_to_text(pr.content, token)
-            except Exception as e:
-                print(f"[aviso] Falha pdf->txt (anexo): {e}", file=sys.stderr)
-
-            extracted = extract_fields_from_pdf_text(edital_txt, anexo_txt)
-            if extracted.get("objetoCompra"):
-                r.objetoCompra = extracted["objetoCompra"]
-            if extracted.get("valorEstimado") is not None:
-                r.valorEstimado = extracted["valorEstimado"]
-            obs = extracted.get("obsPrazosPdf") or {}
-            if obs.get("abertura") and not r.dataAberturaProposta:
-                r.dataAberturaProposta = obs["abertura"]
-            if obs.get("encerramento") and not r.dataEncerramentoProposta:
-                r.dataEncerramentoProposta = obs["encerramento"]
-
-        # Fallback: HTML/JSON
-        if r.valorEstimado is None and page_html:
-            try:
-                v_html = get_best_value_from_page(page_html, link)
-                if v_html is not None:
-                    r.valorEstimado = v_html
-            except Exception as e:
-                print(f"[aviso] Falha ao extrair valor do HTML/JSON: {e}", file=sys.stderr)
-
-        print(f"[depuracao] {r.numeroCompra}/{r.anoCompra}: link={link} edital={edital_url} anexo={anexo_url} valor={r.valorEstimado}", file=sys.stderr)
-
-        # Dados Abertos (última tentativa estruturada)
-        if r.valorEstimado is None:
-            try:
-                v_da = valor_from_dados_abertos(r)
-                if v_da is not None:
-                    r.valorEstimado = v_da
-            except Exception as e:
-                print(f"[aviso] Dados Abertos falhou: {e}", file=sys.stderr)
+    if resultados:
+        with ThreadPoolExecutor(max_workers=min(ENRICH_WORKERS, len(resultados))) as ex:
+            for msgs in ex.map(_run, resultados):
+                if msgs:
+                    log("\n".join(msgs))  # uma escrita por resultado
 
     # IA (opcional)
+    degraded = False
     ai_block: Optional[Dict[str, Any]] = None
-    if parse_flag(args.ai) and (args.openai_key or os.getenv("OPENAI_API_KEY")):
-        key = args.openai_key or os.getenv("OPENAI_API_KEY")
+    if usar_ai:
         try:
-            ai_block = call_openai_summary(ai_payload, key)
+            ai_block = call_openai_summary(ai_payload, openai_key)
         except Exception as e:
+            log(f"[aviso] Falha IA: {e}")
             ai_block = {"resumo": {"executivo": f"Falha IA: {e}"}}
+            degraded = True
 
     ai_block = ensure_ai_defaults(ai_block, resultados) if ai_block is not None else None
     ai_block = ensure_ai_metrics(ai_block, resultados) if ai_block is not None else None
@@ -1174,43 +1758,80 @@ def main():
     try:
         html = build_html(resultados, filtros, ai_block)
     except Exception as e:
-        print(f"[erro] build_html: {e}", file=sys.stderr)
+        log(f"[erro] build_html: {e}")
         html = None
+        degraded = True
     if not isinstance(html, str):
         html = "<!doctype html><meta charset='utf-8'><body><pre>Falha ao gerar HTML.</pre></body>"
 
-    # Sempre grava HTML e JSON
-    html_path = os.path.abspath("licitacoes.html")
-    with open(html_path, "w", encoding="utf-8") as f:
-        f.write(html)
-    print(f"[ok] HTML salvo em: {html_path}", file=sys.stderr)
-
-    if parse_flag(args.pdf):
-        token = args.convertapi_token or os.getenv("CONVERTAPI_TOKEN")
-        if not token:
-            print("[erro] --pdf 1 exige CONVERTAPI_TOKEN", file=sys.stderr)
-            sys.exit(3)
-        print("[info] Convertendo HTML->PDF via ConvertAPI...", file=sys.stderr)
+    pdf_bytes: Optional[bytes] = None
+    if parse_flag(params.get("pdf", 0)):
+        if not convertapi_token:
+            log("[erro] --pdf 1 exige CONVERTAPI_TOKEN")
+            raise ReportError("--pdf 1 exige CONVERTAPI_TOKEN", code=3, html=html.encode("utf-8"))
+        log("[info] Convertendo HTML->PDF via ConvertAPI...")
         try:
-            pdf_bytes = html_to_pdf_via_convertapi(html, token)
+            pdf_bytes = html_to_pdf_via_convertapi(html, convertapi_token)
         except Exception as e:
-            print(f"[erro] Falha na conversão HTML->PDF: {e}", file=sys.stderr)
-            sys.exit(4)
+            log(f"[erro] Falha na conversão HTML->PDF: {e}")
+            raise ReportError(f"Falha na conversão HTML->PDF: {e}", code=4, html=html.encode("utf-8"))
+    else:
+        log("[info] PDF não solicitado (--pdf 0).")
+
+    json_bytes = report_json_bytes(filtros, resultados, ai_block)
+    return html, json_bytes, pdf_bytes, degraded
+
+
+# ======================= Main =======================
+
+def main():
+    p = argparse.ArgumentParser(description="Gerador de relatório de licitações (PNCP)")
+    p.add_argument("--api-key", default="", help="Chave local opcional (simula x-api-key do n8n).")
+    p.add_argument("--openai-key", default=os.getenv("OPENAI_API_KEY", ""), help="OpenAI API key")
+    p.add_argument("--convertapi-token", default=os.getenv("CONVERTAPI_TOKEN", ""), help="Token ConvertAPI")
+    p.add_argument("--palavra", default="")
+    p.add_argument("--uf", default="")
+    p.add_argument("--orgao", default="")
+    p.add_argument("--min-valor", default="0")
+    p.add_argument("--ai", type=int, default=0)
+    p.add_argument("--pdf", type=int, default=0)
+    p.add_argument("--data-inicial", default="20250713")
+    p.add_argument("--data-final", default="20250812")
+    p.add_argument("--modalidade", default="")
+    p.add_argument("--cod-modalidade", default="")
+    p.add_argument("--modo-disputa", default="")
+    p.add_argument("--tamanho-pagina", type=int, default=50)
+    p.add_argument("--filename", default="licitacoes.pdf")
+    p.add_argument("--extract-pdf", type=int, default=1, help="Extrair texto de PDF (1/0). Requer CONVERTAPI_TOKEN para o caminho ConvertAPI; sem ele, tenta pdfminer.")
+    p.add_argument("--debug", type=int, default=0, help="Loga a linha [depuracao] de cada resultado (1/0).")
+    p.add_argument("--cache-dir", default="", help="Pasta de cache do texto extraído dos PDFs (por sha256 do arquivo). Vazio = sem cache.")
+    args = p.parse_args()
+
+    def write_html(data: bytes) -> None:
+        html_path = os.path.abspath("licitacoes.html")
+        with open(html_path, "wb") as f:
+            f.write(data)
+        print(f"[ok] HTML salvo em: {html_path}", file=sys.stderr)
+
+    try:
+        bundle = generate_report(vars(args))
+    except ReportError as e:
+        if e.html is not None:  # falha no PDF: o HTML sai mesmo assim
+            write_html(e.html)
+        sys.exit(e.code)
+
+    # Sempre grava HTML e JSON
+    write_html(bundle.html)
+
+    if bundle.pdf is not None:
         out_name = args.filename or "licitacoes.pdf"
         with open(out_name, "wb") as fw:
-            fw.write(pdf_bytes)
+            fw.write(bundle.pdf)
         print(f"[ok] PDF salvo em: {os.path.abspath(out_name)}", file=sys.stderr)
-    else:
-        print("[info] PDF não solicitado (--pdf 0).", file=sys.stderr)
 
     json_path = os.path.abspath("licitacoes.json")
-    with open(json_path, "w", encoding="utf-8") as jf:
-        json.dump(
-            {"filtros": filtros, "total": len(resultados), "resultados": [asdict(r) for r in resultados], "ai": ai_block},
-            jf,
-            ensure_ascii=False,
-            indent=2,
-        )
+    with open(json_path, "wb") as jf:
+        jf.write(bundle.json)
     print(f"[ok] JSON salvo em: {json_path}", file=sys.stderr)
 
 